@@ -3,8 +3,92 @@ Label Designer
 Creates label images with QR code and text for printing
 """
 
+import functools
+import hashlib
+from itertools import repeat
+import logging
+import math
+import os
+from types import SimpleNamespace
+
 from PIL import Image, ImageDraw, ImageFont
-import qrcode
+import segno
+
+
+logger = logging.getLogger(__name__)
+
+QR_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "label_designer", "qr")
+QR_CACHE_MAX_FILES = 2000  # least recently used files beyond this are deleted
+
+
+@functools.lru_cache(maxsize=256)
+def _load_font(font_path, size):
+    """Open a TrueType face once per (path, size) and reuse it afterwards"""
+    try:
+        return ImageFont.truetype(font_path, size)
+    except Exception:
+        return ImageFont.load_default()
+
+
+@functools.lru_cache(maxsize=4096)
+def _measure_text(text, font):
+    """Return the (width, height) of the text bounding box for a cached font"""
+    left, top, right, bottom = font.getbbox(text)
+    return right - left, bottom - top
+
+
+@functools.lru_cache(maxsize=512)
+def _qr_modules(part_number, quantity):
+    """Encode the label QR code once per (part_number, quantity), one pixel per module"""
+    qr_content = f"[)><RS>06<GS>1P{part_number}<GS>Q{quantity}<RS><EOT>"
+    # Encoder settings are part of the key so a settings change never reads stale files
+    digest = hashlib.sha1(f"segno:l:border2:{qr_content}".encode("utf-8")).hexdigest()
+    cache_path = os.path.join(QR_CACHE_DIR, f"{digest}.png")
+    try:
+        with Image.open(cache_path) as cached:
+            img = cached.convert("1")
+        os.utime(cache_path)  # mtime tracks last use for pruning
+        return img
+    except (OSError, ValueError):
+        pass
+
+    # Smallest regular QR version that fits, kept at error level L
+    qr = segno.make(qr_content, error="l", micro=False, boost_error=False)
+    modules = qr.symbol_size(scale=1, border=2)[0]
+    img = Image.new("1", (modules, modules))
+    img.putdata([0 if dark else 1 for row in qr.matrix_iter(scale=1, border=2) for dark in row])
+
+    try:
+        os.makedirs(QR_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        img.save(tmp_path, "PNG")
+        os.replace(tmp_path, cache_path)
+        _prune_qr_cache()
+    except OSError as exc:
+        logger.debug("Could not write QR cache file %s: %s", cache_path, exc)
+    return img
+
+
+def _prune_qr_cache():
+    """Keep the on-disk QR cache to QR_CACHE_MAX_FILES by dropping the least recently used"""
+    with os.scandir(QR_CACHE_DIR) as entries:
+        files = [entry for entry in entries if entry.name.endswith(".png") and entry.is_file()]
+    excess = len(files) - QR_CACHE_MAX_FILES
+    if excess <= 0:
+        return
+    files.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in files[:excess]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+@functools.lru_cache(maxsize=256)
+def _qr_rendered(part_number, quantity, qr_size):
+    """QR code scaled straight from its module grid to the square it fills on the label"""
+    modules = _qr_modules(part_number, quantity)
+    return modules.resize((qr_size, qr_size), Image.NEAREST).convert("L")
 
 
 class LabelDesigner:
@@ -20,227 +104,262 @@ class LabelDesigner:
         "50mm x 30mm": (394, 236),
     }
 
-    def __init__(self, label_size="50mm x 14mm"):
+    def __init__(self, label_size="50mm x 14mm", antialias_scale=1):
         if label_size not in self.LABEL_SIZES:
             raise ValueError(f"Unsupported label size: {label_size}")
 
         self.label_size = label_size
         self.width, self.height = self.LABEL_SIZES[label_size]
-        self.scale = self.RENDER_SCALE
+        # 1 renders straight at printer resolution; pass RENDER_SCALE to supersample
+        self.scale = max(1, int(antialias_scale))
+        self._geom = self._build_geometry()
+        self._blank = Image.new("L", (self._geom.canvas_width, self._geom.canvas_height), 255)
+        # Specialised per label size; see _make_create_label
+        self.create_label = self._make_create_label()
+
+    def __getstate__(self):
+        # The create_label closure can't be pickled, rebuild it on the other side
+        state = self.__dict__.copy()
+        state.pop("create_label", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.create_label = self._make_create_label()
 
     def mm_to_pixels(self, mm):
         inches = mm / 25.4
         return int(inches * self.DPI)
 
-    def create_qr_code(self, part_number, quantity):
-        qr_content = f"[)><RS>06<GS>1P{part_number}<GS>Q{quantity}<RS><EOT>"
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=2,
-        )
-        qr.add_data(qr_content)
-        qr.make(fit=True)
-        return qr.make_image(fill_color="black", back_color="white")
+    def create_qr_code(self, part_number, quantity, box_size=10):
+        modules = _qr_modules(part_number, quantity)
+        return modules.resize((modules.width * box_size, modules.height * box_size), Image.NEAREST)
 
     def get_font(self, size, bold=False, italic=False):
-        try:
-            if bold and italic:
-                font_path = "C:/Windows/Fonts/arialbi.ttf"
-            elif bold:
-                font_path = "C:/Windows/Fonts/arialbd.ttf"
-            elif italic:
-                font_path = "C:/Windows/Fonts/ariali.ttf"
-            else:
-                font_path = "C:/Windows/Fonts/arial.ttf"
-            return ImageFont.truetype(font_path, size)
-        except Exception:
-            return ImageFont.load_default()
+        if bold and italic:
+            font_path = "C:/Windows/Fonts/arialbi.ttf"
+        elif bold:
+            font_path = "C:/Windows/Fonts/arialbd.ttf"
+        elif italic:
+            font_path = "C:/Windows/Fonts/ariali.ttf"
+        else:
+            font_path = "C:/Windows/Fonts/arial.ttf"
+        return _load_font(font_path, size)
 
-    def create_label(self, part_number, quantity, detailed_description):
-        scale = self.scale
-        canvas = Image.new("RGB", (self.width * scale, self.height * scale), "white")
-        draw = ImageDraw.Draw(canvas)
+    def _make_create_label(self):
+        """Build create_label with this label size's layout constants bound as locals"""
+        geom = self._geom
+        blank = self._blank
+        canvas_width = geom.canvas_width
+        canvas_height = geom.canvas_height
+        qr_size = geom.qr_size
+        qr_position = (geom.qr_x, geom.qr_y)
+        text_x = geom.text_x
+        text_width = geom.text_width
+        available_text_height = geom.available_text_height
+        initial_part_size = geom.initial_part_size
+        initial_qty_size = geom.initial_qty_size
+        initial_desc_size = geom.initial_desc_size
+        min_part_size = geom.min_part_size
+        min_qty_size = geom.min_qty_size
+        min_desc_size = geom.min_desc_size
+        line_spacing = geom.line_spacing
+        size_step = geom.size_step
+        top_margin = geom.top_margin
+        final_size = None if self.scale == 1 else (self.width, self.height)
+        fit_font = self._fit_font
+        get_font = self.get_font
+        wrap_text = self._wrap_text
 
-        qr_img = self.create_qr_code(part_number, quantity)
-        qr_size = self.height * scale - self._scale(8)
-        qr_img = qr_img.resize((qr_size, qr_size), Image.LANCZOS)
-        qr_x = self._scale(4)
-        qr_y = (self.height * scale - qr_size) // 2
-        canvas.paste(qr_img, (qr_x, qr_y))
+        def create_label(part_number, quantity, detailed_description):
+            canvas = blank.copy()
+            canvas.paste(_qr_rendered(part_number, quantity, qr_size), qr_position)
 
-        text_x = qr_x + qr_size + self._scale(10)
-        text_width = self.width * scale - text_x - self._scale(10)
-        available_text_height = self.height * scale - self._scale(8)  # Total available height with margins
-        
-        print(f"[LABEL] Canvas: {self.width * scale}x{self.height * scale}, Text area: {text_width}x{available_text_height}px")
+            logger.debug(
+                "Canvas: %dx%d, Text area: %dx%dpx",
+                canvas_width, canvas_height, text_width, available_text_height,
+            )
+
+            part_text = str(part_number)
+            qty_text = f"Qty: {quantity}"
+
+            # First, fit the part number to the available width
+            # This is independent of height considerations
+            part_font = fit_font(
+                part_text,
+                text_width,
+                start_size=initial_part_size,
+                min_size=min_part_size,
+                bold=True,
+            )
+            actual_part_size = getattr(part_font, 'size', initial_part_size)
+            logger.debug("Part number '%s' fitted to size: %s", part_text, actual_part_size)
+
+            # Try to fit with initial sizes, reducing if necessary
+            reduction = 0
+            attempt = 0
+            max_attempts = 20
+
+            while attempt < max_attempts:
+                attempt += 1
 
-        # Calculate 2mm in pixels at current DPI (203 DPI) and scale
-        # 2mm = 0.0787 inches, at 203 DPI = ~16 pixels, scaled by 2 = 32 pixels
-        max_text_height_px = int(self.mm_to_pixels(3) * scale)
-        
-        # Initial font sizes (these are the defaults we want to use if they fit)
-        initial_part_size = min(self._scale(44), max_text_height_px)
-        initial_qty_size = min(self._scale(20), max_text_height_px)
-        initial_desc_size = self._scale(18)
-        
-        # Minimum font sizes before truncating
-        min_part_size = self._scale(14)
-        min_qty_size = self._scale(12)
-        min_desc_size = self._scale(10)
-        
-        part_text = str(part_number)
-        qty_text = f"Qty: {quantity}"
-        
-        # First, fit the part number to the available width
-        # This is independent of height considerations
-        part_font = self._fit_font(
-            draw,
-            part_text,
-            text_width,
-            start_size=initial_part_size,
-            min_size=min_part_size,
-            bold=True,
-        )
-        actual_part_size = getattr(part_font, 'size', initial_part_size)
-        print(f"[LABEL] Part number '{part_text}' fitted to size: {actual_part_size}")
-        
-        # Try to fit with initial sizes, reducing if necessary
-        line_spacing = self._scale(6)
-        attempt = 0
-        max_attempts = 20
-        
-        while attempt < max_attempts:
-            attempt += 1
-            
-            # Calculate current font sizes for this attempt
-            # Part number size is already determined by width fitting
-            if attempt == 1:
-                part_font_size = actual_part_size
-                qty_font_size = initial_qty_size
-                desc_font_size = initial_desc_size
-            else:
                 # Part number stays at its width-fitted size
                 # Only reduce qty and desc if needed for height
-                reduction = self._scale(2) * (attempt - 1)
-                part_font_size = actual_part_size  # Don't reduce part number further
+                part_font_size = actual_part_size
                 qty_font_size = max(min_qty_size, initial_qty_size - reduction)
                 desc_font_size = max(min_desc_size, initial_desc_size - reduction)
-            
-            # Create fonts (part_font already created from width fitting)
-            qty_font = self.get_font(qty_font_size, bold=True)
-            desc_font = self.get_font(desc_font_size, italic=True)
-            
-            # Calculate heights
-            part_bbox = draw.textbbox((0, 0), part_text, font=part_font)
-            part_height = part_bbox[3] - part_bbox[1]
-            
-            qty_bbox = draw.textbbox((0, 0), qty_text, font=qty_font)
-            qty_height = qty_bbox[3] - qty_bbox[1]
-            
-            desc_bbox = draw.textbbox((0, 0), "Test", font=desc_font)
-            desc_line_height = desc_bbox[3] - desc_bbox[1]
-            
-            # Calculate space for description
-            used_height = part_height + line_spacing + qty_height + line_spacing
-            desc_available_height = available_text_height - used_height
-            
-            # Calculate max lines
-            if desc_available_height > 0:
-                max_desc_lines = max(1, int(desc_available_height / (desc_line_height + line_spacing)))
-            else:
-                max_desc_lines = 0
-            
-            # Wrap description
-            desc_lines = []
-            if detailed_description and max_desc_lines > 0:
-                desc_lines = self._wrap_text(draw, detailed_description.strip(), desc_font, text_width, max_lines=max_desc_lines)
-            
-            # Calculate total height of all content
-            total_content_height = part_height + line_spacing + qty_height
-            if desc_lines:
-                total_content_height += line_spacing + (len(desc_lines) * desc_line_height) + ((len(desc_lines) - 1) * line_spacing)
-            
-            # Check if it fits
-            if total_content_height <= available_text_height:
-                # It fits! Use these sizes
-                print(f"[LABEL] Fit achieved on attempt {attempt}")
-                print(f"[LABEL] Font sizes - Part: {part_font_size}, Qty: {qty_font_size}, Desc: {desc_font_size}")
-                print(f"[LABEL] Total content height: {total_content_height}px / {available_text_height}px available")
-                print(f"[LABEL] Description lines: {len(desc_lines)}")
-                break
-            
-            # Check if we've reached minimum sizes
-            if qty_font_size == min_qty_size and desc_font_size == min_desc_size:
-                # At minimum sizes, just truncate
-                print(f"[LABEL] Reached minimum font sizes, truncating content")
-                print(f"[LABEL] Font sizes - Part: {part_font_size}, Qty: {qty_font_size}, Desc: {desc_font_size}")
-                break
-        
-        # Build final layout
-        layout_lines = [(part_text, part_font), (qty_text, qty_font)]
-        layout_lines.extend((line, desc_font) for line in desc_lines)
-        
-        # Calculate metrics for rendering
-        metrics = []
-        total_height = line_spacing * (len(layout_lines) - 1) if layout_lines else 0
-        for text, font in layout_lines:
-            bbox = draw.textbbox((0, 0), text, font=font)
-            line_height = bbox[3] - bbox[1]
-            metrics.append((text, font, line_height))
-            total_height += line_height
-
-        # Center vertically
-        current_y = max(self._scale(4), (self.height * scale - total_height) // 2)
-        
-        # Render text
-        for idx, (text, font, line_height) in enumerate(metrics):
-            draw.text((text_x, current_y), text, fill="black", font=font)
-            current_y += line_height
-            if idx < len(metrics) - 1:
-                current_y += line_spacing
-
-        return canvas.resize((self.width, self.height), Image.LANCZOS)
+
+                # Create fonts (part_font already created from width fitting)
+                qty_font = get_font(qty_font_size, bold=True)
+                desc_font = get_font(desc_font_size, italic=True)
+
+                # Calculate heights
+                part_height = _measure_text(part_text, part_font)[1]
+                qty_height = _measure_text(qty_text, qty_font)[1]
+                # Cap-height of a sample line; getmetrics() (ascent + descent) is much
+                # taller than the glyphs the layout is sized against and would cost lines
+                desc_line_height = _measure_text("Test", desc_font)[1]
+
+                # Calculate space for description
+                used_height = part_height + line_spacing + qty_height + line_spacing
+                desc_available_height = available_text_height - used_height
+
+                # Calculate max lines
+                if desc_available_height > 0:
+                    max_desc_lines = max(1, int(desc_available_height / (desc_line_height + line_spacing)))
+                else:
+                    max_desc_lines = 0
+
+                # Wrap description
+                desc_lines = []
+                if detailed_description and max_desc_lines > 0:
+                    desc_lines = wrap_text(detailed_description.strip(), desc_font, text_width, max_lines=max_desc_lines)
+
+                # Calculate total height of all content
+                total_content_height = part_height + line_spacing + qty_height
+                if desc_lines:
+                    total_content_height += line_spacing + (len(desc_lines) * desc_line_height) + ((len(desc_lines) - 1) * line_spacing)
+
+                # Check if it fits
+                if total_content_height <= available_text_height:
+                    # It fits! Use these sizes
+                    logger.debug(
+                        "Fit achieved on attempt %d - Part: %s, Qty: %s, Desc: %s, "
+                        "height %dpx / %dpx available, %d description lines",
+                        attempt, part_font_size, qty_font_size, desc_font_size,
+                        total_content_height, available_text_height, len(desc_lines),
+                    )
+                    break
+
+                # Check if we've reached minimum sizes
+                if qty_font_size == min_qty_size and desc_font_size == min_desc_size:
+                    # At minimum sizes, just truncate
+                    logger.debug(
+                        "Reached minimum font sizes, truncating content - Part: %s, Qty: %s, Desc: %s",
+                        part_font_size, qty_font_size, desc_font_size,
+                    )
+                    break
+
+                # Shrinking a font by one size frees at most a pixel per line, so jump
+                # straight to the smallest reduction that could cover the overflow
+                overflow = total_content_height - available_text_height
+                shrinking_lines = 1 + len(desc_lines)
+                reduction += size_step * max(1, math.ceil(overflow / (shrinking_lines * size_step)))
+
+            # Lay out with the heights the fit loop already measured
+            metrics = [(part_text, part_font, part_height), (qty_text, qty_font, qty_height)]
+            metrics.extend((line, desc_font, desc_line_height) for line in desc_lines)
+
+            # Center vertically
+            current_y = max(top_margin, (canvas_height - total_content_height) // 2)
+
+            # Render text
+            draw = ImageDraw.Draw(canvas)
+            for idx, (text, font, line_height) in enumerate(metrics):
+                draw.text((text_x, current_y), text, fill=0, font=font)
+                current_y += line_height
+                if idx < len(metrics) - 1:
+                    current_y += line_spacing
+
+            if final_size is None:
+                return canvas
+            return canvas.resize(final_size, Image.LANCZOS)
+
+        return create_label
+
+    def create_labels_batch(self, specs, executor=None):
+        """Render (part_number, quantity, detailed_description) specs, spread over executor if given
+
+        executor should be a long-lived ProcessPoolExecutor; workers receive only the
+        label size and spec and keep their own designer per size.
+        """
+        specs = list(specs)
+        if executor is None or len(specs) <= 1:
+            return [self.create_label(*spec) for spec in specs]
+        count = len(specs)
+        part_numbers, quantities, descriptions = zip(*specs)
+        return list(executor.map(
+            _render_label,
+            repeat(self.label_size, count),
+            repeat(self.scale, count),
+            part_numbers,
+            quantities,
+            descriptions,
+            chunksize=4,
+        ))
 
     def save_label_preview(self, label_image, output_path):
         label_image.save(output_path, "PNG")
         return output_path
 
-    def _fit_font(self, draw, text, max_width, start_size=24, min_size=10, **font_kwargs):
+    def _fit_font(self, text, max_width, start_size=24, min_size=10, **font_kwargs):
         size = start_size
-        decrement = max(2, self.scale * 2)
         while size >= min_size:
             font = self.get_font(size, **font_kwargs)
             try:
-                bbox = draw.textbbox((0, 0), text, font=font)
-                text_width = bbox[2] - bbox[0]
+                text_width = _measure_text(text, font)[0]
             except Exception:
                 text_width = len(text) * size * 0.5
             if text_width <= max_width:
                 return font
-            size -= decrement
+            # Width grows linearly with size, so jump straight to the size that
+            # should fit; another pass only happens if hinting leaves it too wide
+            size = int(size * max_width / text_width)
         return self.get_font(min_size, **font_kwargs)
 
-    def _wrap_text(self, draw, text, font, max_width, max_lines=3):
+    def _wrap_text(self, text, font, max_width, max_lines=3):
         words = text.split()
+        # Measure every word once and grow lines by adding advance widths
+        try:
+            word_widths = [font.getlength(word) for word in words]
+            space_width = font.getlength(" ")
+            close_call = space_width
+        except Exception:
+            char_width = getattr(font, "size", 10) * 0.5
+            word_widths = [len(word) * char_width for word in words]
+            space_width = char_width
+            close_call = -1
         lines = []
         current = ""
+        current_width = 0
         idx = 0
         truncated = False
 
         while idx < len(words):
             word = words[idx]
-            candidate = f"{current} {word}".strip() if current else word
-            try:
-                bbox = draw.textbbox((0, 0), candidate, font=font)
-                width = bbox[2] - bbox[0]
-            except Exception:
-                fallback_size = getattr(font, "size", 10)
-                width = len(candidate) * fallback_size * 0.5
+            if current:
+                advance = current_width + space_width + word_widths[idx]
+            else:
+                advance = word_widths[idx]
+            candidate = f"{current} {word}" if current else word
+            width = advance
+            if abs(advance - max_width) <= close_call:
+                # Advances ignore glyph overhang, so settle near misses on the ink box
+                width = _measure_text(candidate, font)[0]
 
             if width <= max_width:
                 current = candidate
+                current_width = advance
                 idx += 1
                 continue
 
@@ -250,6 +369,7 @@ class LabelDesigner:
                 lines.append(word)
                 idx += 1
             current = ""
+            current_width = 0
 
             if len(lines) == max_lines:
                 truncated = True
@@ -269,5 +389,50 @@ class LabelDesigner:
 
         return lines
 
+    def _build_geometry(self):
+        """Layout constants that depend only on the label size and render scale"""
+        scale = self.scale
+        canvas_width = self.width * scale
+        canvas_height = self.height * scale
+        qr_size = canvas_height - self._scale(8)
+        qr_x = self._scale(4)
+        text_x = qr_x + qr_size + self._scale(10)
+
+        # Cap the part number and quantity lines at 3mm tall
+        max_text_height_px = int(self.mm_to_pixels(3) * scale)
+
+        return SimpleNamespace(
+            canvas_width=canvas_width,
+            canvas_height=canvas_height,
+            qr_size=qr_size,
+            qr_x=qr_x,
+            qr_y=(canvas_height - qr_size) // 2,
+            text_x=text_x,
+            text_width=canvas_width - text_x - self._scale(10),
+            available_text_height=canvas_height - self._scale(8),  # Total available height with margins
+            # Initial font sizes (these are the defaults we want to use if they fit)
+            initial_part_size=min(self._scale(44), max_text_height_px),
+            initial_qty_size=min(self._scale(20), max_text_height_px),
+            initial_desc_size=self._scale(18),
+            # Minimum font sizes before truncating
+            min_part_size=self._scale(14),
+            min_qty_size=self._scale(12),
+            min_desc_size=self._scale(10),
+            line_spacing=self._scale(6),
+            size_step=self._scale(2),
+            top_margin=self._scale(4),
+        )
+
     def _scale(self, value):
         return int(value * self.scale)
+
+
+@functools.lru_cache(maxsize=None)
+def _worker_designer(label_size, antialias_scale):
+    return LabelDesigner(label_size, antialias_scale)
+
+
+def _render_label(label_size, antialias_scale, part_number, quantity, detailed_description):
+    """Process-pool worker for LabelDesigner.create_labels_batch"""
+    designer = _worker_designer(label_size, antialias_scale)
+    return designer.create_label(part_number, quantity, detailed_description)
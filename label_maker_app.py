@@ -7,83 +7,223 @@ Now with NIIMBOT B1 printer support!
 import tkinter as tk
 from tkinter import ttk
 import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import os
+import re
 import asyncio
+import functools
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Optional
+import hashlib
+import importlib
+import importlib.util
+import json
+import logging
 import time
-from PIL import Image, ImageTk
 import webbrowser
 
+HAS_HTTPX = importlib.util.find_spec("httpx") is not None
+
 try:
-    import requests
+    from orjson import loads as json_loads
 except ImportError:  # pragma: no cover
-    requests = None
+    json_loads = json.loads
 
-from niimbot_printer import NiimbotPrinter
 from label_designer import LabelDesigner
 
 
+logger = logging.getLogger(__name__)
+
+
+_ENV_LINE = re.compile(r"^[ \t]*([^#=\s][^=\n]*)=(.*)$", re.M)
+
+
 def load_env_file():
     env_path = os.path.join(os.path.dirname(__file__), ".env")
     if not os.path.exists(env_path):
         return
 
     with open(env_path, "r", encoding="utf-8") as env_file:
-        for raw_line in env_file:
-            line = raw_line.strip()
-            if not line or line.startswith("#") or "=" not in line:
-                continue
-            key, value = line.split("=", 1)
-            key = key.strip()
-            value = value.strip()
-            if key and value and key not in os.environ:
-                os.environ[key] = value
+        data = env_file.read()
+
+    for match in _ENV_LINE.finditer(data):
+        key = match[1].strip()
+        value = match[2].strip()
+        if key and value:
+            os.environ.setdefault(key, value)
 
 
 load_env_file()
 
 
+@functools.lru_cache(maxsize=4)
+def _theme_bg(theme):
+    """Background colour of a ttk theme's frames (empty if the theme sets none)"""
+    style = ttk.Style()
+    return style.lookup('TFrame', 'background') or style.lookup('TLabel', 'background')
+
+
+@dataclass(frozen=True)
+class DigiKeyPart:
+    """Label fields extracted from a DigiKey product"""
+    display_part_number: str
+    detailed_description: str
+    manufacturer: Optional[str] = None
+    product_url: Optional[str] = None
+
+
 class DigiKeyClient:
     """Minimal client for retrieving DigiKey part metadata."""
 
     TOKEN_URL = "https://api.digikey.com/v1/oauth2/token"
     PRODUCT_DETAILS_URL = "https://api.digikey.com/products/v4/search/{partnumber}/productdetails"
+    PART_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "clm_parts.json")
+    PART_CACHE_TTL = 7 * 24 * 60 * 60  # seconds
+    TOKEN_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "clm_token.json")
+    RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+    RETRY_ATTEMPTS = 2
+    RETRY_BACKOFF = 0.3  # seconds, doubled on each retry
 
     def __init__(self, client_id, client_secret):
         self.client_id = client_id
         self.client_secret = client_secret
         self.access_token = None
         self.token_expiry = 0
-        self.session = requests.Session() if requests else None
+        self._token_lock = asyncio.Lock()
+        # Async client driven from the app's asyncio loop; token and product requests
+        # share one pooled HTTP/2 connection to api.digikey.com
+        self.session = None
+        if HAS_HTTPX:
+            import httpx
+            # Pool settings belong on the transport; the client ignores them once one is given
+            transport = httpx.AsyncHTTPTransport(
+                http2=True,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                retries=2,  # connection failures only
+            )
+            self.session = httpx.AsyncClient(transport=transport, timeout=20)
+        self._ok = bool(self.session and client_id and client_secret)
+        self._part_cache = self._load_part_cache()
+        self._part_cache_dirty = False
+        self._load_token()
+
+    def _load_token(self):
+        """Reuse an access token saved by a previous run for the same client ID"""
+        try:
+            with open(self.TOKEN_CACHE_PATH, "r", encoding="utf-8") as token_file:
+                saved = json.load(token_file)
+            if saved.get("client_id") != self.client_id:
+                return
+            self.access_token = saved["access_token"]
+            self.token_expiry = float(saved["token_expiry"])
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            pass
+
+    def _save_token(self):
+        saved = {
+            "client_id": self.client_id,
+            "access_token": self.access_token,
+            "token_expiry": self.token_expiry,
+        }
+        try:
+            os.makedirs(os.path.dirname(self.TOKEN_CACHE_PATH), exist_ok=True)
+            fd = os.open(self.TOKEN_CACHE_PATH, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as token_file:
+                json.dump(saved, token_file)
+            os.chmod(self.TOKEN_CACHE_PATH, 0o600)
+        except OSError as e:
+            logger.warning("Could not save access token: %s", e)
+
+    def _load_part_cache(self):
+        """Load previously fetched products, dropping entries past their TTL"""
+        try:
+            with open(self.PART_CACHE_PATH, "r", encoding="utf-8") as cache_file:
+                cache = json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(cache, dict):
+            return {}
+
+        now = time.time()
+        return {
+            part_number: entry
+            for part_number, entry in cache.items()
+            if isinstance(entry, dict)
+            and isinstance(entry.get("part"), dict)
+            and now - entry.get("fetched_at", 0) < self.PART_CACHE_TTL
+        }
+
+    def save_part_cache(self):
+        """Write the product cache to disk if anything new was fetched"""
+        if not self._part_cache_dirty:
+            return
+        # fetch_part may still be adding entries on the async loop; entries are
+        # replaced rather than mutated, so a shallow copy is a consistent snapshot
+        snapshot = dict(self._part_cache)
+        tmp_path = f"{self.PART_CACHE_PATH}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.PART_CACHE_PATH), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as cache_file:
+                json.dump(snapshot, cache_file)
+            os.replace(tmp_path, self.PART_CACHE_PATH)
+            self._part_cache_dirty = False
+        except OSError as e:
+            logger.warning("Could not save part cache: %s", e)
 
     def is_configured(self):
-        return bool(
-            self.session
-            and self.client_id
-            and self.client_secret
-        )
+        return self._ok
+
+    async def aclose(self):
+        if self.session:
+            await self.session.aclose()
 
-    def _ensure_access_token(self):
+    async def _ensure_access_token(self):
         if not self.is_configured():
             return None
         if self.access_token and time.time() < (self.token_expiry - 30):
             return self.access_token
 
-        data = {
-            "client_id": self.client_id,
-            "client_secret": self.client_secret,
-            "grant_type": "client_credentials",
-        }
-        response = self.session.post(self.TOKEN_URL, data=data, timeout=20)
-        response.raise_for_status()
-        payload = response.json()
-        self.access_token = payload.get("access_token")
-        self.token_expiry = time.time() + payload.get("expires_in", 1800)
-        return self.access_token
+        # Concurrent lookups wait for a single refresh instead of each requesting a token
+        async with self._token_lock:
+            if self.access_token and time.time() < (self.token_expiry - 30):
+                return self.access_token
+
+            data = {
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+                "grant_type": "client_credentials",
+            }
+            response = await self.session.post(self.TOKEN_URL, data=data)
+            response.raise_for_status()
+            payload = json_loads(response.content)
+            self.access_token = payload.get("access_token")
+            self.token_expiry = time.time() + payload.get("expires_in", 1800)
+            self._save_token()
+            return self.access_token
+
+    async def _get_with_retry(self, url, headers):
+        """GET that retries rate-limit and server errors with exponential backoff"""
+        for attempt in range(self.RETRY_ATTEMPTS + 1):
+            response = await self.session.get(url, headers=headers)
+            if response.status_code not in self.RETRY_STATUSES or attempt == self.RETRY_ATTEMPTS:
+                return response
+            delay = self.RETRY_BACKOFF * (2 ** attempt)
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            logger.debug("DigiKey returned %d for %s; retrying in %.1fs", response.status_code, url, delay)
+            await asyncio.sleep(delay)
 
-    def fetch_part(self, part_number):
-        token = self._ensure_access_token()
+    async def fetch_part(self, part_number):
+        cached = self._part_cache.get(part_number)
+        if cached and time.time() - cached.get("fetched_at", 0) < self.PART_CACHE_TTL:
+            logger.debug("Using cached part data for: %s", part_number)
+            return DigiKeyPart(**cached["part"])
+
+        token = await self._ensure_access_token()
         if not token:
-            print(f"[API] No access token available for {part_number}")
+            logger.debug("No access token available for %s", part_number)
             raise Exception("DigiKey API authentication failed - no access token available")
 
         headers = {
@@ -93,47 +233,76 @@ class DigiKeyClient:
         }
         
         url = self.PRODUCT_DETAILS_URL.format(partnumber=part_number)
-        print(f"[API] Requesting part data for: {part_number}")
-        print(f"[API] URL: {url}")
+        logger.debug("Requesting part data for: %s (%s)", part_number, url)
         
-        response = self.session.get(url, headers=headers, timeout=20)
+        response = await self._get_with_retry(url, headers)
         response.raise_for_status()
-        data = response.json()
+        data = json_loads(response.content)
         
-        print(f"[API] Response keys: {list(data.keys())}")
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("Response keys: %s", list(data.keys()))
         
         product = data.get("Product")
         if not product:
-            print("[API] No Product found in response")
+            logger.debug("No Product found in response")
             raise Exception(f"DigiKey API returned no product for part number: {part_number}")
         
-        print(f"[API] Product keys: {list(product.keys())}")
+        if debug:
+            logger.debug("Product keys: %s", list(product.keys()))
         
         # The Description field is a dictionary containing ProductDescription and DetailedDescription
         description_obj = product.get("Description")
         if not description_obj or not isinstance(description_obj, dict):
-            print("[API] ERROR: Description field not found or is not a dictionary!")
+            logger.debug("Description field not found or is not a dictionary")
             raise Exception(f"DigiKey API response missing 'Description' field for {part_number}")
         
-        print(f"[API] Description object keys: {list(description_obj.keys())}")
+        if debug:
+            logger.debug("Description object keys: %s", list(description_obj.keys()))
         
         detailed_desc = description_obj.get("DetailedDescription", "").strip()
         product_desc = description_obj.get("ProductDescription", "").strip()
         
         if not detailed_desc:
-            print("[API] WARNING: DetailedDescription is empty, using ProductDescription")
+            logger.debug("DetailedDescription is empty, using ProductDescription")
             detailed_desc = product_desc
         
         if not detailed_desc:
-            print("[API] ERROR: Both description fields are empty!")
+            logger.debug("Both description fields are empty")
             raise Exception(f"DigiKey API returned empty description for {part_number}")
         
-        print(f"[API] SUCCESS: DetailedDescription = '{detailed_desc}'")
-        print(f"[API] SUCCESS: ProductDescription = '{product_desc}'")
-        return product
+        logger.debug("DetailedDescription = '%s', ProductDescription = '%s'", detailed_desc, product_desc)
+
+        manufacturer = product.get("Manufacturer") or {}
+        if isinstance(manufacturer, dict):
+            manufacturer = manufacturer.get("Value") or manufacturer.get("Name")
+        else:
+            manufacturer = str(manufacturer)
+
+        part = DigiKeyPart(
+            display_part_number=product.get("ManufacturerProductNumber") or part_number,
+            detailed_description=detailed_desc,
+            manufacturer=manufacturer,
+            product_url=product.get("ProductUrl"),
+        )
+        logger.debug(
+            "Final part number: '%s', description: '%s'",
+            part.display_part_number, part.detailed_description,
+        )
+        self._part_cache[part_number] = {"part": asdict(part), "fetched_at": time.time()}
+        self._part_cache_dirty = True
+        return part
 
 
 class LabelMakerApp:
+    PREVIEW_CACHE_SIZE = 16
+    BATCH_FETCH_CONCURRENCY = 8  # DigiKey lookups in flight at once during a batch
+    # Header text tag -> (phrase to link, target URL)
+    _LINKS = {
+        "link": (re.compile(r"DigiKey Organizer Project"), "https://github.com/grossrc/DigiKey_Organizer"),
+        "link_docs": (re.compile(r"\bhere\b"), "https://github.com/grossrc/Component-Label-Maker"),
+    }
+
     def __init__(self, root):
         self.root = root
         self.root.title("Component Label Maker v2.0")
@@ -147,26 +316,36 @@ class LabelMakerApp:
         # Custom styles
         style.configure('Blue.TButton', font=('Segoe UI', 10, 'bold'), background='#2196F3', foreground='white')
         style.map('Blue.TButton', background=[('active', '#1976D2'), ('disabled', '#cccccc')])
-        self.bg_color = style.lookup('TFrame', 'background') or style.lookup('TLabel', 'background') or self.root.cget('bg')
+        self.bg_color = _theme_bg(style.theme_use()) or self.root.cget('bg')
         
         # API credentials from environment variables
         self.client_id = os.getenv("DIGIKEY_CLIENT_ID")
         self.client_secret = os.getenv("DIGIKEY_CLIENT_SECRET")
         self.digikey_client = DigiKeyClient(self.client_id, self.client_secret)
+        self._last_part = None  # (part_number, DigiKeyPart) from the last generate
         
         # Printer setup
         self.printer = None
+        self._niimbot = None  # driver module, imported on first printer action
+        self._printer_cache = {}  # model name -> NiimbotPrinter
         self.printer_model = "B1"  # Default to B1
         self.available_printers = []
         self.async_loop = None
         self.async_thread = None
+        # Blocking printer actions share two long-lived workers
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="clm")
+        self._render_pool = None  # ProcessPoolExecutor for batch rendering, started on first batch
         
         # Label preview
         self.current_label_image = None
         self.preview_photo = None
+        self._preview_cache = OrderedDict()
+        self._designer_cache = {}  # label size -> LabelDesigner
         
         # UI State
         self.is_busy = False
+        self._pending_progress = None
+        self._progress_lock = threading.Lock()
         
         # Start async loop for printer communication
         self.setup_async_loop()
@@ -224,26 +403,14 @@ class LabelMakerApp:
         desc_text.insert(tk.END, full_text)
         
         # Add links
-        desc_text.tag_config("link", foreground="blue", underline=1)
-        desc_text.tag_bind("link", "<Enter>", lambda e: desc_text.config(cursor="hand2"))
-        desc_text.tag_bind("link", "<Leave>", lambda e: desc_text.config(cursor=""))
-        
-        # Find and tag "DigiKey Organizer Project"
-        start_idx = full_text.find("DigiKey Organizer Project")
-        if start_idx != -1:
-            end_idx = start_idx + len("DigiKey Organizer Project")
-            desc_text.tag_add("link", f"1.0 + {start_idx} chars", f"1.0 + {end_idx} chars")
-            desc_text.tag_bind("link", "<Button-1>", lambda e: webbrowser.open("https://github.com/grossrc/DigiKey_Organizer"))
-            
-        # Find and tag "here"
-        start_idx = full_text.find("here")
-        if start_idx != -1:
-            end_idx = start_idx + len("here")
-            desc_text.tag_add("link_docs", f"1.0 + {start_idx} chars", f"1.0 + {end_idx} chars")
-            desc_text.tag_config("link_docs", foreground="blue", underline=1)
-            desc_text.tag_bind("link_docs", "<Enter>", lambda e: desc_text.config(cursor="hand2"))
-            desc_text.tag_bind("link_docs", "<Leave>", lambda e: desc_text.config(cursor=""))
-            desc_text.tag_bind("link_docs", "<Button-1>", lambda e: webbrowser.open("https://github.com/grossrc/Component-Label-Maker"))
+        for tag, (pattern, url) in self._LINKS.items():
+            desc_text.tag_config(tag, foreground="blue", underline=1)
+            desc_text.tag_bind(tag, "<Enter>", lambda e: desc_text.config(cursor="hand2"))
+            desc_text.tag_bind(tag, "<Leave>", lambda e: desc_text.config(cursor=""))
+            desc_text.tag_bind(tag, "<Button-1>", lambda e, url=url: webbrowser.open(url))
+            for match in pattern.finditer(full_text):
+                start_idx, end_idx = match.span()
+                desc_text.tag_add(tag, f"1.0 + {start_idx} chars", f"1.0 + {end_idx} chars")
             
         desc_text.config(state='disabled')
         
@@ -281,6 +448,7 @@ class LabelMakerApp:
                      
         ttk.Label(pf_row1, text="Label Size:", font=('Segoe UI', 10)).pack(side=tk.LEFT, padx=15)
         self.label_size_var = tk.StringVar(value="50mm x 30mm")
+        self.label_size_var.trace_add("write", lambda *_: self._clear_last_part())
         ttk.Combobox(pf_row1, textvariable=self.label_size_var, values=list(LabelDesigner.LABEL_SIZES.keys()),
                      state="readonly", width=15).pack(side=tk.LEFT, padx=5)
         
@@ -316,6 +484,9 @@ class LabelMakerApp:
                                       state='disabled', style='Blue.TButton')
         self.print_button.pack(side=tk.LEFT, padx=10)
         
+        self.batch_button = ttk.Button(btn_inner, text="Batch Print...", command=self.open_batch_dialog)
+        self.batch_button.pack(side=tk.LEFT, padx=10)
+        
         # --- Preview Section ---
         preview_frame = ttk.LabelFrame(main_frame, text="Label Preview", padding="10")
         preview_frame.pack(fill=tk.BOTH, expand=False, pady=5)
@@ -340,9 +511,19 @@ class LabelMakerApp:
         
     def update_progress(self, value, status_text):
         """Update progress bar and status label"""
+        # Rapid updates collapse into one redraw with the latest values
+        with self._progress_lock:
+            schedule = self._pending_progress is None
+            self._pending_progress = (value, status_text)
+        if schedule:
+            self.root.after_idle(self._apply_progress)
+
+    def _apply_progress(self):
+        with self._progress_lock:
+            value, status_text = self._pending_progress
+            self._pending_progress = None
         self.progress_bar['value'] = value
         self.status_label.config(text=status_text)
-        self.root.update_idletasks()
 
     def notify_user(self, message, level="info"):
         """Display inline status feedback instead of pop-up dialogs."""
@@ -358,13 +539,28 @@ class LabelMakerApp:
 
         self.root.after(0, _update)
         
+    def _printer_class(self):
+        """Import the NIIMBOT driver (and bleak) only when a printer is needed"""
+        if self._niimbot is None:
+            self._niimbot = importlib.import_module("niimbot_printer")
+        return self._niimbot.NiimbotPrinter
+
+    def _get_printer(self):
+        """Return the printer object for the selected model, creating it once"""
+        model = self.model_var.get()
+        printer = self._printer_cache.get(model)
+        if printer is None:
+            printer = self._printer_class()(model)
+            self._printer_cache[model] = printer
+        return printer
+
     def scan_printers(self):
         """Scan for available NIIMBOT printers"""
         self.set_loading_state(True, "Scanning for NIIMBOT printers...")
         
         def scan_thread():
             try:
-                printer = NiimbotPrinter(self.model_var.get())
+                printer = self._get_printer()
                 future = self.run_async(printer.scan_for_printers(timeout=10))
                 devices = future.result(timeout=15)
                 
@@ -389,8 +585,7 @@ class LabelMakerApp:
             finally:
                 self.root.after(0, lambda: self.set_loading_state(False, "Scan complete"))
         
-        thread = threading.Thread(target=scan_thread, daemon=True)
-        thread.start()
+        self._executor.submit(scan_thread)
         
     def toggle_connection(self):
         """Connect or disconnect from printer"""
@@ -417,7 +612,7 @@ class LabelMakerApp:
         def connect_thread():
             try:
                 device = self.available_printers[selected_idx]
-                self.printer = NiimbotPrinter(self.model_var.get())
+                self.printer = self._get_printer()
                 
                 future = self.run_async(self.printer.connect(device['address']))
                 success = future.result(timeout=30)
@@ -432,8 +627,7 @@ class LabelMakerApp:
             finally:
                 self.root.after(0, lambda: self.set_loading_state(False, "Connection complete" if self.printer and self.printer.connected else "Connection failed"))
         
-        thread = threading.Thread(target=connect_thread, daemon=True)
-        thread.start()
+        self._executor.submit(connect_thread)
         
     def disconnect_printer(self):
         """Disconnect from printer"""
@@ -445,7 +639,7 @@ class LabelMakerApp:
         def disconnect_thread():
             try:
                 future = self.run_async(self.printer.disconnect())
-                future.result(timeout=10)
+                future.result(timeout=self.printer.JOB_CLOSE_TIMEOUT + 10)
                 
                 self.printer = None
                 self.root.after(0, lambda: self.connection_status.config(text="⚫ Disconnected", foreground='red'))
@@ -455,8 +649,7 @@ class LabelMakerApp:
             finally:
                 self.root.after(0, lambda: self.set_loading_state(False, "Disconnected"))
         
-        thread = threading.Thread(target=disconnect_thread, daemon=True)
-        thread.start()
+        self._executor.submit(disconnect_thread)
         
     def generate_label(self):
         """Generate label preview"""
@@ -475,25 +668,31 @@ class LabelMakerApp:
         self.set_loading_state(True, "Generating label...")
         self.notify_user("", "info")
         
-        # Run in separate thread
-        thread = threading.Thread(target=self.process_label, 
-                                 args=(part_number, quantity))
-        thread.daemon = True
-        thread.start()
+        # Run on the async loop alongside printer communication
+        self.run_async(self.process_label(part_number, quantity))
         
-    def process_label(self, part_number, quantity):
-        """Process the label generation (runs in separate thread)"""
+    async def process_label(self, part_number, quantity):
+        """Process the label generation (runs on the async loop)"""
         try:
             # Step 1: Fetch part details
-            self.root.after(0, lambda: self.status_label.config(text="Fetching part details from DigiKey..."))
-            part_details = self.fetch_part_details(part_number)
-            detailed_description = part_details.get("detailed_description") or f"Component: {part_number}"
-            display_part_number = part_details.get("display_part_number", part_number)
+            last_part = self._last_part
+            if last_part and last_part[0] == part_number:
+                # Same part as the previous label (e.g. only the quantity changed)
+                part_details = last_part[1]
+            else:
+                self.root.after(0, lambda: self.status_label.config(text="Fetching part details from DigiKey..."))
+                part_details = await self.fetch_part_details(part_number)
+                self._last_part = (part_number, part_details)
+            detailed_description = part_details.detailed_description or f"Component: {part_number}"
+            display_part_number = part_details.display_part_number
             
             # Step 2: Generate label design
             self.root.after(0, lambda: self.status_label.config(text="Designing label..."))
-            designer = LabelDesigner(self.label_size_var.get())
-            label_image = designer.create_label(display_part_number, quantity, detailed_description)
+            designer = self._designer()
+            # Rendering is CPU-bound; keep it off the loop that drives BLE and HTTP
+            label_image = await asyncio.get_running_loop().run_in_executor(
+                None, designer.create_label, display_part_number, quantity, detailed_description
+            )
             
             self.current_label_image = label_image
             
@@ -510,6 +709,159 @@ class LabelMakerApp:
             self.root.after(0, lambda msg=error_msg: self.notify_user(f"An error occurred: {msg}", "error"))
         finally:
             self.root.after(0, lambda: self.set_loading_state(False, "Preview generated" if self.current_label_image else "Generation failed"))
+
+    def open_batch_dialog(self):
+        """Ask for several part numbers and print a label for each"""
+        if not self.printer or not self.printer.connected:
+            self.notify_user("Connect to a printer before batch printing.", "warning")
+            return
+        if self.is_busy:
+            self.notify_user("Wait for the current operation to finish before batch printing.", "warning")
+            return
+
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Batch Print")
+        dialog.transient(self.root)
+        # Modal, so no single print can start while the batch is being set up
+        dialog.grab_set()
+        ttk.Label(dialog, text="One part per line: PART NUMBER, QUANTITY (quantity defaults to 1)",
+                  font=('Segoe UI', 9)).pack(padx=10, pady=(10, 5))
+        entries = tk.Text(dialog, width=50, height=12, font=('Segoe UI', 10))
+        entries.pack(padx=10, pady=5)
+        error_label = ttk.Label(dialog, text="", font=('Segoe UI', 9), foreground='#c0392b')
+        error_label.pack()
+
+        def _start():
+            if self.is_busy:
+                error_label.config(text="Another operation is still running.")
+                return
+            parts_and_qty = []
+            for line_no, line in enumerate(entries.get("1.0", tk.END).splitlines(), 1):
+                part_number, _, quantity = line.partition(",")
+                part_number, quantity = part_number.strip(), quantity.strip() or "1"
+                if not part_number:
+                    continue
+                if not quantity.isdigit():
+                    error_label.config(text=f"Line {line_no}: quantity must be a positive integer.")
+                    return
+                parts_and_qty.append((part_number, quantity))
+            if not parts_and_qty:
+                error_label.config(text="Enter at least one part number.")
+                return
+
+            dialog.destroy()
+            self.notify_user("", "info")
+            self.set_loading_state(True, f"Generating {len(parts_and_qty)} labels...")
+            self.process_labels_batch(parts_and_qty, on_complete=self._print_batch)
+
+        ttk.Button(dialog, text="Generate & Print", command=_start,
+                   style='Blue.TButton').pack(pady=(5, 10))
+        entries.focus_set()
+
+    def _print_batch(self, results):
+        """Send generated batch labels to the printer (Tk thread)"""
+        labels = [(part_number, image) for part_number, _, image in results if not isinstance(image, Exception)]
+        failed = [part_number for part_number, _, image in results if isinstance(image, Exception)]
+        if not labels or not self.printer or not self.printer.connected:
+            reason = "no labels could be generated" if not labels else "the printer is not connected"
+            self.notify_user(f"Batch print failed: {reason}.", "error")
+            self.set_loading_state(False, "Batch failed")
+            return
+        self.run_async(self._do_print_batch(self.printer, labels, failed))
+
+    async def _do_print_batch(self, printer, labels, failed):
+        """Print batch labels one after another (runs on the async loop)"""
+        printed = 0
+        error_msg = None
+        try:
+            for index, (part_number, label_image) in enumerate(labels, 1):
+                self.root.after(0, lambda i=index: self.status_label.config(text=f"Printing label {i} of {len(labels)}..."))
+                await asyncio.wait_for(printer.print_image(label_image, density=3, quantity=1), timeout=120)
+                printed += 1
+            await asyncio.wait_for(printer.wait_for_completion(), timeout=120)
+        except asyncio.TimeoutError:
+            if printed < len(labels):
+                error_msg = f"the printer did not accept label {printed + 1} within 2 minutes"
+            else:
+                error_msg = "the printer did not report the last label as finished within 2 minutes"
+        except Exception as e:
+            error_msg = str(e) or type(e).__name__
+        finally:
+            summary = f"Printed {printed} of {len(labels) + len(failed)} labels."
+            if failed:
+                summary += f" Lookup failed for: {', '.join(failed)}."
+            if error_msg:
+                summary += f" Printing stopped: {error_msg}"
+            level = "success" if printed and not failed and not error_msg else "warning" if printed else "error"
+            self.root.after(0, lambda: self.notify_user(summary, level))
+            self.root.after(0, lambda: self.set_loading_state(False, "Batch complete" if printed else "Batch failed"))
+
+    def process_labels_batch(self, parts_and_qty, on_complete=None):
+        """Generate labels for several (part_number, quantity) pairs with overlapping lookups.
+
+        on_complete is called on the Tk thread with a list of
+        (part_number, quantity, label_image_or_exception) tuples in input order.
+        """
+        parts_and_qty = list(parts_and_qty)
+        future = self.run_async(self._build_labels(parts_and_qty))
+
+        def _done(fut):
+            try:
+                results = fut.result()
+            except Exception as e:
+                error_msg = str(e)
+                self.root.after(0, lambda msg=error_msg: self.notify_user(f"Batch generation failed: {msg}", "error"))
+                self.root.after(0, lambda: self.set_loading_state(False, "Batch failed"))
+                return
+            if on_complete:
+                self.root.after(0, lambda: on_complete(results))
+
+        future.add_done_callback(_done)
+        return future
+
+    async def _fetch_all(self, part_numbers):
+        """Look up every part concurrently; failures come back as exceptions"""
+        semaphore = asyncio.Semaphore(self.BATCH_FETCH_CONCURRENCY)
+
+        async def _fetch(part_number):
+            async with semaphore:
+                return await self.fetch_part_details(part_number)
+
+        details = await asyncio.gather(
+            *(_fetch(part_number) for part_number in part_numbers),
+            return_exceptions=True,
+        )
+        return dict(zip(part_numbers, details))
+
+    async def _build_labels(self, parts_and_qty):
+        unique_parts = list(dict.fromkeys(part_number for part_number, _ in parts_and_qty))
+        details_by_part = await self._fetch_all(unique_parts)
+
+        specs = []
+        for part_number, quantity in parts_and_qty:
+            part_details = details_by_part[part_number]
+            if isinstance(part_details, Exception):
+                continue
+            detailed_description = part_details.detailed_description or f"Component: {part_number}"
+            specs.append((part_details.display_part_number, quantity, detailed_description))
+
+        # Render in worker processes, waiting from a thread so the loop keeps serving BLE and HTTP
+        designer = self._designer()
+        images = iter(await asyncio.get_running_loop().run_in_executor(
+            None, designer.create_labels_batch, specs, self._get_render_pool()
+        ))
+
+        results = []
+        for part_number, quantity in parts_and_qty:
+            part_details = details_by_part[part_number]
+            label_image = part_details if isinstance(part_details, Exception) else next(images)
+            results.append((part_number, quantity, label_image))
+        return results
+
+    def _get_render_pool(self):
+        if self._render_pool is None:
+            self._render_pool = ProcessPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+        return self._render_pool
     
     def show_preview(self, label_image, part_number, quantity, description):
         """Show label preview in embedded UI"""
@@ -530,9 +882,22 @@ class LabelMakerApp:
         new_width = int(label_image.width * scale)
         new_height = int(label_image.height * scale)
         
-        # Resize with high-quality resampling for better preview
-        display_image = label_image.resize((new_width, new_height), Image.LANCZOS)
-        self.preview_photo = ImageTk.PhotoImage(display_image)
+        from PIL import Image, ImageTk
+
+        # Re-previews of an identical design reuse the resized photo
+        digest = hashlib.blake2b(label_image.tobytes(), digest_size=16).digest()
+        cache_key = (digest, label_image.mode, label_image.size, new_width, new_height, self.label_size_var.get())
+        photo = self._preview_cache.get(cache_key)
+        if photo is None:
+            # The preview is never printed, so a cheap bilinear resample is plenty
+            display_image = label_image.resize((new_width, new_height), Image.BILINEAR)
+            photo = ImageTk.PhotoImage(display_image)
+            self._preview_cache[cache_key] = photo
+            if len(self._preview_cache) > self.PREVIEW_CACHE_SIZE:
+                self._preview_cache.popitem(last=False)
+        else:
+            self._preview_cache.move_to_end(cache_key)
+        self.preview_photo = photo
         
         # Update preview image
         self.preview_label.config(image=self.preview_photo)
@@ -563,99 +928,98 @@ class LabelMakerApp:
 
         self.set_loading_state(True, "Preparing to print...")
 
-        model_info = NiimbotPrinter.MODELS.get(self.model_var.get().lower())
+        model_info = self._printer_class().MODELS.get(self.model_var.get().lower())
         if model_info:
             max_width = model_info.get("max_width")
             if max_width and self.current_label_image.width > max_width:
-                print(
-                    f"Label width {self.current_label_image.width}px exceeds {self.model_var.get().upper()} limit; auto-scaling before print."
+                logger.debug(
+                    "Label width %dpx exceeds %s limit; auto-scaling before print.",
+                    self.current_label_image.width, self.model_var.get().upper(),
                 )
         self.notify_user("", "info")
         
-        def print_thread():
-            try:
-                self.root.after(0, lambda: self.status_label.config(text="Sending to printer..."))
-                
-                # Print with default density of 3
-                future = self.run_async(
-                    self.printer.print_image(
-                        self.current_label_image,
-                        density=3,
-                        quantity=1,
-                    )
-                )
-                
-                self.root.after(0, lambda: self.status_label.config(text="Printing in progress..."))
-                
-                # Wait for print to actually complete with longer timeout
-                result = future.result(timeout=120)
-                
-                self.root.after(0, lambda: self.status_label.config(text="Finalizing..."))
-                
-                # Give printer a moment to finish
-                time.sleep(2)
-                
-                self.root.after(0, lambda: self.notify_user("Label printed successfully!", "success"))
-            except Exception as e:
-                error_msg = str(e)
+        self.run_async(self._do_print(self.printer, self.current_label_image))
+
+    async def _do_print(self, printer, label_image):
+        """Send a label to the printer (runs on the async loop)"""
+        sent = False
+        error_msg = None
+        try:
+            self.root.after(0, lambda: self.status_label.config(text="Sending to printer..."))
+            
+            # Print with default density of 3
+            await asyncio.wait_for(printer.print_image(label_image, density=3, quantity=1), timeout=120)
+            sent = True
+            # Controls are usable again while the page prints; a new job waits for this one
+            self.root.after(0, lambda: self.set_loading_state(False, "Printing in progress..."))
+            
+            await asyncio.wait_for(printer.wait_for_completion(), timeout=120)
+            self.root.after(0, lambda: self.notify_user("Label printed successfully!", "success"))
+            self.root.after(0, self._show_print_done)
+        except asyncio.TimeoutError:
+            if sent:
+                error_msg = "the printer did not report the label as finished within 2 minutes"
+            else:
+                # print_image closes the job itself if it was cut off after starting it
+                error_msg = "the printer did not accept the label within 2 minutes"
+        except asyncio.CancelledError:
+            error_msg = "printing was interrupted"
+            raise
+        except Exception as e:
+            error_msg = str(e) or type(e).__name__
+        finally:
+            if error_msg:
                 self.root.after(0, lambda msg=error_msg: self.notify_user(f"Failed to print: {msg}", "error"))
-            finally:
-                self.root.after(0, lambda: self.set_loading_state(False, "Print complete"))
-        
-        thread = threading.Thread(target=print_thread, daemon=True)
-        thread.start()
+                if sent:
+                    self.root.after(0, lambda: self._show_print_done("Print failed"))
+                else:
+                    self.root.after(0, lambda: self.set_loading_state(False, "Print failed"))
+
+    def _show_print_done(self, message="Print complete"):
+        # Leave the status alone if another action has started since this job was sent
+        if not self.is_busy:
+            self.status_label.config(text=message)
     
-    def fetch_part_details(self, part_number):
-        """Fetch part details from DigiKey API with strict validation"""
-        part_info = {
-            "display_part_number": part_number,
-            "detailed_description": None,
-        }
+    def _designer(self):
+        """Return the LabelDesigner for the selected label size, creating it once"""
+        size = self.label_size_var.get()
+        designer = self._designer_cache.get(size)
+        if designer is None:
+            designer = LabelDesigner(size)
+            self._designer_cache[size] = designer
+        return designer
 
+    def _clear_last_part(self):
+        self._last_part = None
+
+    async def fetch_part_details(self, part_number):
+        """Fetch part details from DigiKey API with strict validation"""
         if not self.digikey_client or not self.digikey_client.is_configured():
             raise Exception("DigiKey API is not configured. Please check .env file for CLIENT_ID and CLIENT_SECRET")
 
         # Strict mode: API must succeed
-        product = self.digikey_client.fetch_part(part_number)
-        
-        # Extract part number (prefer manufacturer part number)
-        part_info["display_part_number"] = (
-            product.get("ManufacturerProductNumber")
-            or part_number
-        )
-        
-        # Extract DetailedDescription from nested Description object
-        description_obj = product.get("Description", {})
-        if isinstance(description_obj, dict):
-            detailed_desc = (description_obj.get("DetailedDescription") or "").strip()
-            product_desc = (description_obj.get("ProductDescription") or "").strip()
-            # Prefer detailed description, fall back to product description
-            part_info["detailed_description"] = detailed_desc or product_desc
-        else:
-            part_info["detailed_description"] = str(description_obj).strip()
-        
-        # Optional fields
-        manufacturer = product.get("Manufacturer") or {}
-        if isinstance(manufacturer, dict):
-            part_info["manufacturer"] = manufacturer.get("Value") or manufacturer.get("Name")
-        else:
-            part_info["manufacturer"] = str(manufacturer)
-            
-        part_info["product_url"] = product.get("ProductUrl")
-        
-        print(f"[API] Final extracted description: '{part_info['detailed_description']}'")
-        print(f"[API] Final part number: '{part_info['display_part_number']}'")
-        return part_info
+        return await self.digikey_client.fetch_part(part_number)
     
     def on_closing(self):
         """Handle window closing"""
+        self.digikey_client.save_part_cache()
+        try:
+            self.run_async(self.digikey_client.aclose()).result(timeout=5)
+        except Exception:
+            pass
+
         if self.printer and self.printer.connected:
             try:
+                # disconnect() may first let an in-flight job finish printing
                 future = self.run_async(self.printer.disconnect())
-                future.result(timeout=5)
+                future.result(timeout=self.printer.JOB_CLOSE_TIMEOUT + 5)
             except:
                 pass
         
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._render_pool is not None:
+            self._render_pool.shutdown(wait=False, cancel_futures=True)
+
         if self.async_loop:
             self.async_loop.call_soon_threadsafe(self.async_loop.stop)
         
@@ -664,45 +1028,55 @@ class LabelMakerApp:
     def set_loading_state(self, is_loading, message=""):
         """Set the UI to a loading state"""
         self.is_busy = is_loading
-        
-        if is_loading:
-            self.root.config(cursor="wait")
-            self.progress_bar.config(mode='indeterminate')
-            self.progress_bar.start(10)
-            self.status_label.config(text=message)
+
+        def _apply():
+            if is_loading:
+                self.root.config(cursor="wait")
+                self.progress_bar.config(mode='indeterminate')
+                self.progress_bar.start(10)
+                self.status_label.config(text=message)
             
-            # Disable controls
-            self.scan_button.config(state='disabled')
-            self.connect_button.config(state='disabled')
-            self.generate_button.config(state='disabled')
-            self.print_button.config(state='disabled')
-            self.part_number_entry.config(state='disabled')
-            self.quantity_entry.config(state='disabled')
+                # Disable controls
+                self.scan_button.config(state='disabled')
+                self.connect_button.config(state='disabled')
+                self.generate_button.config(state='disabled')
+                self.print_button.config(state='disabled')
+                self.batch_button.config(state='disabled')
+                self.part_number_entry.config(state='disabled')
+                self.quantity_entry.config(state='disabled')
             
-        else:
-            self.root.config(cursor="")
-            self.progress_bar.stop()
-            self.progress_bar.config(mode='determinate', value=0)
-            self.status_label.config(text=message if message else "Ready")
+            else:
+                self.root.config(cursor="")
+                self.progress_bar.stop()
+                self.progress_bar.config(mode='determinate', value=0)
+                self.status_label.config(text=message if message else "Ready")
             
-            # Enable controls
-            self.scan_button.config(state='normal')
-            self.connect_button.config(state='normal')
-            self.generate_button.config(state='normal')
-            self.part_number_entry.config(state='normal')
-            self.quantity_entry.config(state='normal')
+                # Enable controls
+                self.scan_button.config(state='normal')
+                self.connect_button.config(state='normal')
+                self.generate_button.config(state='normal')
+                self.batch_button.config(state='normal')
+                self.part_number_entry.config(state='normal')
+                self.quantity_entry.config(state='normal')
             
-            # Only enable print if we have a preview and printer is connected
-            if self.current_label_image and self.printer and self.printer.connected:
-                self.print_button.config(state='normal')
-            else:
-                self.print_button.config(state='disabled')
+                # Only enable print if we have a preview and printer is connected
+                if self.current_label_image and self.printer and self.printer.connected:
+                    self.print_button.config(state='normal')
+                else:
+                    self.print_button.config(state='disabled')
                 
-            # Update connect button text based on state
-            if self.printer and self.printer.connected:
-                self.connect_button.config(text="Disconnect")
-            else:
-                self.connect_button.config(text="Connect")
+                # Update connect button text based on state
+                if self.printer and self.printer.connected:
+                    self.connect_button.config(text="Disconnect")
+                else:
+                    self.connect_button.config(text="Connect")
+
+        if threading.current_thread() is threading.main_thread():
+            # Disable controls right away so a second click can't slip in before they update
+            _apply()
+        else:
+            # Tk widgets may only be touched from the Tk thread
+            self.root.after(0, _apply)
 
     def clear_part_number(self):
         """Clear the part number entry field and reset quantity"""